@@ -11,6 +11,7 @@ DEFAULT_TOP_K = 15
 DEFAULT_CRAWL_CONCURRENCY = 8
 DEFAULT_MAX_CHARS = 5000
 DEFAULT_STATE_TTL = 7200  # 2小时
+DEFAULT_MAX_PER_HOST = 2  # 每个站点最多抓取的页面数
 
 # 运行模式 (默认非 headless，以便用户能看到验证页面)
 HEADLESS = os.getenv("HEADLESS", "false").lower() == "true"
@@ -1,15 +1,18 @@
 """MCP 服务入口"""
 import asyncio
 from mcp.server.stdio import stdio_server
-from tools import server
+from tools import server, close_browser
 
 async def main():
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
+            )
+    finally:
+        await close_browser()
 
 if __name__ == "__main__":
     asyncio.run(main())
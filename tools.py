@@ -14,11 +14,11 @@ sys.path.insert(0, str(Path(__file__).parent / "webSeach"))
 from search_engines import multi_search_with_context
 from page_crawler import crawl_page_content
 from models import PageResult
-from utils import clean_page_text, move_browser_window_offscreen
+from utils import clean_page_text, move_browser_window_offscreen, normalize_url, site_key
 from state_cache import StateCacheManager
 from config import (
     DEFAULT_TOP_K, DEFAULT_CRAWL_CONCURRENCY,
-    DEFAULT_MAX_CHARS, DEFAULT_STATE_TTL, HEADLESS
+    DEFAULT_MAX_CHARS, DEFAULT_STATE_TTL, DEFAULT_MAX_PER_HOST, HEADLESS
 )
 
 # 固定使用所有搜索引擎
@@ -27,6 +27,37 @@ ALL_ENGINES = ["duckduckgo", "baidu"]
 # 创建 MCP 服务器
 server = Server("webSeach-server")
 
+# 浏览器复用：进程内共享一个 Playwright / Browser，每次调用只新建 BrowserContext
+_BROWSER_LOCK = asyncio.Lock()
+_PLAYWRIGHT = None
+_BROWSER = None
+
+
+async def _get_browser():
+    """懒启动共享浏览器（断开后自动重启）"""
+    global _PLAYWRIGHT, _BROWSER
+    async with _BROWSER_LOCK:
+        if _BROWSER is None or not _BROWSER.is_connected():
+            if _PLAYWRIGHT is None:
+                _PLAYWRIGHT = await async_playwright().start()
+            _BROWSER = await _PLAYWRIGHT.chromium.launch(headless=HEADLESS)
+        return _BROWSER
+
+
+async def close_browser() -> None:
+    """关闭共享浏览器（服务退出时调用）"""
+    global _PLAYWRIGHT, _BROWSER
+    async with _BROWSER_LOCK:
+        if _BROWSER is not None:
+            try:
+                await _BROWSER.close()
+            except Exception:
+                pass
+            _BROWSER = None
+        if _PLAYWRIGHT is not None:
+            await _PLAYWRIGHT.stop()
+            _PLAYWRIGHT = None
+
 # 工具定义
 TOOLS = [
     Tool(
@@ -95,14 +126,14 @@ async def _web_search(
 
     state_manager = StateCacheManager(ttl_seconds=DEFAULT_STATE_TTL)
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=HEADLESS)
+    browser = await _get_browser()
 
-        state = await state_manager.load_merged_state(engines)
-        context = await browser.new_context(
-            storage_state=state if state else None
-        )
+    state = await state_manager.load_merged_state(engines)
+    context = await browser.new_context(
+        storage_state=state if state else None
+    )
 
+    try:
         # 保持窗口（非 headless 模式）
         if not HEADLESS:
             await context.new_page()
@@ -118,10 +149,14 @@ async def _web_search(
             state_manager=state_manager,
         )
 
+        # 抓取前去重：避免同一页面被重复抓取
+        results = _dedup_crawl_targets(results, max_per_host=DEFAULT_MAX_PER_HOST)
+
         # 抓取阶段
         sem = asyncio.Semaphore(crawl_concurrency)
+        host_sems: dict = {}
         tasks = [
-            crawl_page_content(context, sem, it, max_chars=max_chars)
+            crawl_page_content(context, sem, it, host_sems=host_sems, max_chars=max_chars)
             for it in results
         ]
         pages_raw = await asyncio.gather(*tasks, return_exceptions=True)
@@ -134,22 +169,29 @@ async def _web_search(
             pages.append(r)
 
         # 保存状态
-        for engine in engines:
-            await state_manager.save_context_state(context, engine)
+        await state_manager.save_context_states(context, engines)
 
-        await browser.close()
+    finally:
+        await context.close()
 
     # 过滤 good 结果并去重
     good_results = [p for p in pages if p.is_good]
 
-    # 去重（按 URL）
+    # 去重（按 URL），并按实际到达的站点限量（跳转链接在抓取前无法判断站点）
     seen_urls = set()
+    per_host: dict = {}
     deduped = []
     for p in good_results:
         url = str(p.final_url or p.url)
-        if url not in seen_urls:
-            seen_urls.add(url)
-            deduped.append(p)
+        if url in seen_urls:
+            continue
+        host = site_key(url)
+        if host is not None and per_host.get(host, 0) >= DEFAULT_MAX_PER_HOST:
+            continue
+        seen_urls.add(url)
+        if host is not None:
+            per_host[host] = per_host.get(host, 0) + 1
+        deduped.append(p)
 
     # 格式化返回
     if format == "md":
@@ -160,6 +202,28 @@ async def _web_search(
     return [TextContent(type="text", text=result_text)]
 
 
+def _dedup_crawl_targets(results: List[dict], *, max_per_host: int) -> List[dict]:
+    """
+    按规范化 URL 去重，并限制每个站点的数量（保持原有顺序）；
+    搜索引擎跳转链接（如百度 /link）不计入站点限量，抓取后再按 final_url 限量
+    """
+    seen = set()
+    per_host: dict = {}
+    targets = []
+    for it in results:
+        key = normalize_url(it["url"])
+        if key in seen:
+            continue
+        host = site_key(key)
+        if host is not None:
+            if per_host.get(host, 0) >= max_per_host:
+                continue
+            per_host[host] = per_host.get(host, 0) + 1
+        seen.add(key)
+        targets.append(it)
+    return targets
+
+
 def _format_json(pages: List[PageResult], query: str) -> str:
     """格式化为 JSON"""
     results = []
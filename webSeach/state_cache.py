@@ -1,6 +1,7 @@
 import asyncio
 import json
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, List
 from playwright.async_api import BrowserContext
@@ -42,6 +43,11 @@ class StateCacheManager:
         # 每个引擎一个独立的锁，防止并发写入冲突
         self._locks: Dict[str, asyncio.Lock] = {}
 
+        # 元数据内存缓存：首次使用时从磁盘加载一次，修改只标记 dirty，由 flush() 统一落盘
+        self._metadata: Optional[Dict] = None
+        self._metadata_lock = asyncio.Lock()
+        self._metadata_dirty = False
+
     def _get_lock(self, engine_name: str) -> asyncio.Lock:
         """获取指定引擎的锁（懒初始化）"""
         if engine_name not in self._locks:
@@ -52,30 +58,61 @@ class StateCacheManager:
         """获取指定引擎的状态文件路径"""
         return self.cache_dir / f"{engine_name}_state.json"
 
-    async def _load_metadata(self) -> Dict:
-        """加载元数据文件"""
+    # ---- 阻塞文件 I/O：统一经 asyncio.to_thread 调用，避免卡住事件循环 ----
+
+    @staticmethod
+    def _read_json(path: Path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_json(path: Path, data, *, compact: bool = False) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            if compact:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            else:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def _load_metadata_sync(self) -> Dict:
         if not self.metadata_file.exists():
             return {}
         try:
-            with open(self.metadata_file, "r", encoding="utf-8") as f:
-                return json.load(f)
+            return self._read_json(self.metadata_file)
         except (json.JSONDecodeError, IOError):
             return {}
 
-    async def _save_metadata(self, metadata: Dict) -> None:
-        """保存元数据文件"""
-        with open(self.metadata_file, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+    async def _load_metadata(self) -> Dict:
+        """获取元数据（内存缓存，首次调用时从磁盘加载）"""
+        if self._metadata is None:
+            async with self._metadata_lock:
+                if self._metadata is None:
+                    self._metadata = await asyncio.to_thread(self._load_metadata_sync)
+        return self._metadata
+
+    async def flush(self) -> None:
+        """将修改过的元数据写回磁盘（未修改则不写）"""
+        async with self._metadata_lock:
+            if not self._metadata_dirty or self._metadata is None:
+                return
+            # 写快照：避免线程序列化时事件循环里还在修改
+            snapshot = {k: dict(v) for k, v in self._metadata.items()}
+            self._metadata_dirty = False
+            await asyncio.to_thread(self._write_json, self.metadata_file, snapshot)
 
     def _is_expired(self, engine_meta: Dict) -> bool:
-        """检查状态是否已过期"""
-        if "expires_at" not in engine_meta:
-            return True
-        try:
-            expires_at = datetime.fromisoformat(engine_meta["expires_at"])
-            return datetime.now() > expires_at
-        except (ValueError, KeyError):
+        """检查状态是否已过期（时间戳均为 Unix epoch 秒）"""
+        expires_at = engine_meta.get("expires_at")
+        # 旧版元数据存的是 ISO 字符串，直接视为过期
+        if not isinstance(expires_at, (int, float)):
             return True
+        return time.time() > expires_at
+
+    @staticmethod
+    def _to_iso(ts) -> Optional[str]:
+        """epoch 秒 -> 可读时间（仅用于 get_cache_info 展示）"""
+        if not isinstance(ts, (int, float)):
+            return ts
+        return datetime.fromtimestamp(ts).isoformat()
 
     async def is_state_valid(self, engine_name: str) -> bool:
         """
@@ -107,19 +144,20 @@ class StateCacheManager:
         state_path = self._get_state_path(engine_name)
         async with self._get_lock(engine_name):
             try:
-                with open(state_path, "r", encoding="utf-8") as f:
-                    state = json.load(f)
+                state = await asyncio.to_thread(self._read_json, state_path)
 
                 # 更新最后使用时间
                 metadata = await self._load_metadata()
-                metadata[engine_name]["last_used"] = datetime.now().isoformat()
-                await self._save_metadata(metadata)
+                metadata[engine_name]["last_used"] = time.time()
+                self._metadata_dirty = True
 
                 return state
             except (json.JSONDecodeError, IOError):
-                # 文件损坏，清理
-                await self.invalidate_state(engine_name)
-                return None
+                pass
+
+        # 文件损坏，清理（需在锁外调用：invalidate_state 会再次获取同一把锁）
+        await self.invalidate_state(engine_name)
+        return None
 
     async def save_state(self, engine_name: str, state: dict) -> bool:
         """
@@ -133,21 +171,25 @@ class StateCacheManager:
             try:
                 # 过滤：只保存白名单域名的 cookies 和 origins
                 allowed_domains = self.ENGINE_DOMAINS.get(engine_name, [])
+                allowed = frozenset(allowed_domains)
+                allowed_suffixes = tuple("." + ad for ad in allowed_domains)
+                allowed_origins = frozenset(
+                    scheme + ad for ad in allowed_domains for scheme in ("https://", "http://")
+                )
 
                 # 过滤 cookies
                 filtered_cookies = []
                 if "cookies" in state:
                     for cookie in state["cookies"]:
                         domain = cookie.get("domain", "").lstrip(".")
-                        if any(domain == ad or domain.endswith("." + ad) for ad in allowed_domains):
+                        if domain in allowed or domain.endswith(allowed_suffixes):
                             filtered_cookies.append(cookie)
 
                 # 过滤 origins
                 filtered_origins = []
                 if "origins" in state:
                     for origin in state["origins"]:
-                        origin_str = origin.get("origin", "")
-                        if any(origin_str == f"https://{ad}" or origin_str == f"http://{ad}" for ad in allowed_domains):
+                        if origin.get("origin", "") in allowed_origins:
                             filtered_origins.append(origin)
 
                 # 只保存过滤后的状态
@@ -156,19 +198,18 @@ class StateCacheManager:
                     "origins": filtered_origins,
                 }
 
-                # 写入状态文件
-                with open(state_path, "w", encoding="utf-8") as f:
-                    json.dump(filtered_state, f, ensure_ascii=False, indent=2)
+                # 写入状态文件（紧凑格式：cookies/localStorage 体积大，缩进会让文件和序列化开销翻倍）
+                await asyncio.to_thread(self._write_json, state_path, filtered_state, compact=True)
 
                 # 更新元数据
                 metadata = await self._load_metadata()
-                now = datetime.now()
+                now = time.time()
                 metadata[engine_name] = {
-                    "created_at": now.isoformat(),
-                    "expires_at": (now + timedelta(seconds=self.ttl_seconds)).isoformat(),
-                    "last_used": now.isoformat(),
+                    "created_at": now,
+                    "expires_at": now + self.ttl_seconds,
+                    "last_used": now,
                 }
-                await self._save_metadata(metadata)
+                self._metadata_dirty = True
 
                 return True
             except IOError as e:
@@ -186,11 +227,34 @@ class StateCacheManager:
         """
         try:
             state = await context.storage_state()
-            return await self.save_state(engine_name, state)
+            ok = await self.save_state(engine_name, state)
+            await self.flush()
+            return ok
         except Exception as e:
             print(f"[warn] Failed to extract storage state for {engine_name}: {e}")
             return False
 
+    async def save_context_states(
+        self, context: BrowserContext, engine_names: List[str]
+    ) -> bool:
+        """
+        从浏览器上下文一次性提取状态，并按引擎分别保存
+        :param context: Playwright BrowserContext 对象
+        :param engine_names: 引擎名称列表
+        :return: True 如果全部保存成功
+        """
+        try:
+            state = await context.storage_state()
+        except Exception as e:
+            print(f"[warn] Failed to extract storage state: {e}")
+            return False
+
+        ok = True
+        for engine_name in engine_names:
+            ok = await self.save_state(engine_name, state) and ok
+        await self.flush()
+        return ok
+
     async def load_merged_state(self, engine_names: List[str]) -> Optional[dict]:
         """
         加载多个引擎的状态并合并
@@ -199,10 +263,14 @@ class StateCacheManager:
         """
         merged = {"cookies": [], "origins": []}
 
+        # 各引擎读取互不依赖，并发进行
+        states = await asyncio.gather(
+            *(self.load_state(n) for n in engine_names), return_exceptions=True
+        )
+
         has_valid = False
-        for engine_name in engine_names:
-            state = await self.load_state(engine_name)
-            if state:
+        for state in states:
+            if state and not isinstance(state, BaseException):
                 has_valid = True
                 # 合并 cookies
                 if "cookies" in state:
@@ -213,6 +281,15 @@ class StateCacheManager:
 
         return merged if has_valid else None
 
+    async def load_cookies(self, engine_name: str) -> List[dict]:
+        """
+        只加载指定引擎的 cookies（供 context.add_cookies 使用，跳过 origins 存储的回放）
+        :param engine_name: 引擎名称
+        :return: cookie 列表，无有效状态时为空列表
+        """
+        state = await self.load_state(engine_name)
+        return (state or {}).get("cookies", [])
+
     async def invalidate_state(self, engine_name: str) -> None:
         """
         使指定引擎的缓存状态失效（删除文件）
@@ -221,15 +298,14 @@ class StateCacheManager:
         state_path = self._get_state_path(engine_name)
         async with self._get_lock(engine_name):
             try:
-                if state_path.exists():
-                    state_path.unlink()
+                await asyncio.to_thread(state_path.unlink, missing_ok=True)
             except IOError as e:
                 print(f"[warn] Failed to delete state file for {engine_name}: {e}")
 
             # 从元数据中移除
             metadata = await self._load_metadata()
-            metadata.pop(engine_name, None)
-            await self._save_metadata(metadata)
+            if metadata.pop(engine_name, None) is not None:
+                self._metadata_dirty = True
 
     async def cleanup_expired_states(self) -> int:
         """
@@ -245,6 +321,7 @@ class StateCacheManager:
 
         for engine_name in expired:
             await self.invalidate_state(engine_name)
+        await self.flush()
 
         return len(expired)
 
@@ -261,9 +338,9 @@ class StateCacheManager:
             info[engine_name] = {
                 "exists": state_path.exists(),
                 "is_valid": not self._is_expired(engine_meta),
-                "created_at": engine_meta.get("created_at"),
-                "expires_at": engine_meta.get("expires_at"),
-                "last_used": engine_meta.get("last_used"),
+                "created_at": self._to_iso(engine_meta.get("created_at")),
+                "expires_at": self._to_iso(engine_meta.get("expires_at")),
+                "last_used": self._to_iso(engine_meta.get("last_used")),
             }
 
         return info
@@ -1,10 +1,13 @@
 import asyncio
+import io
+import logging
 import random
 import re
 import os
-from typing import Iterable
+from typing import Iterable, Optional
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
 # Debug 控制 (默认开启，可通过环境变量 DEBUG=false 关闭)
 DEBUG = os.getenv("DEBUG", "true").lower() == "true"
@@ -16,18 +19,21 @@ LOG_FILE = LOG_DIR / "debug.log"
 # 确保日志目录存在
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 
+# 文件句柄只打开一次（不再每条日志 open/close）；不向根 logger 传播，避免污染 MCP stdio
+_logger = logging.getLogger("webSeach")
+_logger.setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+_logger.propagate = False
+if not _logger.handlers:
+    _handler = logging.FileHandler(LOG_FILE, encoding="utf-8", delay=True)
+    _handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    _handler.handleError = lambda record: None  # 静默失败，避免日志错误影响主逻辑
+    _logger.addHandler(_handler)
+
 
 def _log(*args, **kwargs):
     """仅在 DEBUG 模式下输出日志到文件"""
-    if DEBUG:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            with open(LOG_FILE, "a", encoding="utf-8") as f:
-                f.write(f"[{timestamp}] ")
-                f.write(" ".join(str(arg) for arg in args))
-                f.write("\n")
-        except Exception as e:
-            pass  # 静默失败，避免日志错误影响主逻辑
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug(" ".join(str(arg) for arg in args))
 
 async def human_sleep(base_ms: int, jitter_ms: int = 400):
     """
@@ -79,6 +85,59 @@ async def move_browser_window_offscreen(browser, left: int = -20000, top: int =
 
 
 
+# 跟踪参数：不影响页面内容，去重时忽略
+_TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "yclid", "spm", "ref_src"}
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化 URL（仅用于去重的 key，不用于访问）：
+    - scheme / host 小写，http 统一为 https
+    - 去掉 utm_* / fbclid / gclid 等跟踪参数和 #fragment
+    - 去掉末尾的 /
+    """
+    try:
+        u = urlsplit(url.strip())
+    except ValueError:
+        return url
+    scheme = u.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+    query = [
+        (k, v) for k, v in parse_qsl(u.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in _TRACKING_PARAMS
+    ]
+    path = u.path.rstrip("/")
+    return urlunsplit((scheme, u.netloc.lower(), path, urlencode(query), ""))
+
+
+# 搜索引擎的跳转链接（host -> path）：真实站点要抓取后才知道（final_url）
+_REDIRECT_LINKS = {
+    "www.baidu.com": "/link",
+    "baidu.com": "/link",
+    "www.bing.com": "/ck/a",
+}
+
+
+def site_key(url: str) -> Optional[str]:
+    """
+    按站点限量用的 key（小写 host）；搜索引擎跳转链接返回 None，
+    因为它们的 host 是搜索引擎本身，而不是用户实际到达的站点
+    """
+    try:
+        u = urlsplit(url.strip())
+    except ValueError:
+        return None
+    host = u.netloc.lower()
+    if _REDIRECT_LINKS.get(host) == u.path:
+        return None
+    return host
+
+
+# 列表项：- / * / • 或 "1." 开头
+_LIST_RE = re.compile(r"^\s*(?:[-*•]\s|\d+\.\s)")
+
+
 def clean_page_text(
     text: str,
     *,
@@ -95,46 +154,53 @@ def clean_page_text(
         return ""
 
     lines = text.splitlines()
-    out: list[str] = []
+    out = io.StringIO()
     buffer: list[str] = []
 
+    def emit(piece: str):
+        # 段落之间用空行分隔；首段去掉前导空白（等价于整体 strip）
+        if out.tell():
+            out.write("\n\n")
+        else:
+            piece = piece.lstrip()
+        out.write(piece)
+
     def flush():
         if buffer:
-            out.append(" ".join(buffer).strip())
+            emit(" ".join(buffer))
             buffer.clear()
 
     for ln in lines:
-        ln = ln.rstrip()
+        # 已超出长度上限：后面的内容反正会被截掉
+        if out.tell() > max_chars:
+            break
+
+        # 每行只 strip 一次；仅代码块分支需要保留原始缩进
+        stripped = ln.strip()
 
         # 空行：段落边界
-        if not ln.strip():
+        if not stripped:
             flush()
             continue
 
         # 代码块 / markdown / 列表：强制独立成段
-        if (
-            ln.startswith(("    ", "\t", "```"))
-            or re.match(r"^\s*[-*•]\s+", ln)
-            or re.match(r"^\s*\d+\.\s+", ln)
-        ):
+        if ln.startswith(("    ", "\t", "```")) or _LIST_RE.match(stripped):
             flush()
-            out.append(ln)
+            emit(ln.rstrip())
             continue
 
         # 看起来像标题（非常保守）
-        if len(ln) < 80 and ln.endswith(":"):
+        if len(stripped) < 80 and stripped.endswith(":"):
             flush()
-            out.append(ln.strip())
+            emit(stripped)
             continue
 
         # 普通文本：合并
-        buffer.append(ln.strip())
+        buffer.append(stripped)
 
     flush()
 
-    text = "\n\n".join(out)
-    text = re.sub(r"\n{3,}", "\n\n", text).strip()
-
+    text = out.getvalue()
     if len(text) > max_chars:
         text = text[:max_chars] + "\n\n...[TRUNCATED]..."
 
@@ -149,6 +215,41 @@ captcha_lock = asyncio.Lock()
 # Global CAPTCHA pause lock - when any task encounters verification, other tasks pause
 captcha_pause_lock = asyncio.Lock()
 
+# 验证页面特征元素（Bing / Cloudflare Turnstile / reCAPTCHA 等）
+_CAPTCHA_SELECTORS = [
+    ".captcha",
+    ".captcha_header",
+    ".captcha_text",
+    "#turnstile-widget",
+    "[data-sitekey]",
+    'iframe[src*="microsoft"]',
+    'iframe[src*="recaptcha"]',
+    'iframe[src*="challenges.cloudflare.com"]',
+    'iframe[src*="cf-chl"]',
+    'input[name="cf-turnstile-response"]',
+    ".captcha-box",
+]
+
+# URL / 正文关键词（模块加载时编译一次）
+_CAPTCHA_URL_RE = re.compile(r"captcha|challenge|verify|recaptcha|hcaptcha|cf-chl|__cf_chl_|turnstile")
+_CAPTCHA_TEXT_RE = re.compile("|".join(map(re.escape, [
+    "请解决以下难题", "最后一步", "确认您是真人", "人机验证", "安全验证",
+    "verify you are human", "prove you're not a robot", "just a moment", "challenge platform",
+])))
+
+# 验证是否已完成：特征元素、URL 关键词、正文关键词均不再出现
+_CAPTCHA_GONE_JS = """
+([sels, urlPattern, textPattern]) => {
+  for (const s of sels) if (document.querySelector(s)) return false;
+  if (new RegExp(urlPattern).test(location.href.toLowerCase())) return false;
+  const text = (document.body?.innerText || "").toLowerCase();
+  return !new RegExp(textPattern).test(text);
+}
+"""
+
+# 在浏览器内一次检查全部选择器，返回命中的选择器（无则 null）
+_CAPTCHA_MATCH_JS = "(sels) => { for (const s of sels) if (document.querySelector(s)) return s; return null; }"
+
 
 async def is_captcha_page(page) -> bool:
     """
@@ -157,84 +258,29 @@ async def is_captcha_page(page) -> bool:
     url = page.url.lower()
     _log(f"[CAPTCHA] 开始检测，URL: {url}")
 
-    # 0. 先检查页面是否有基本内容
-    try:
-        body_html = await page.evaluate("() => document.body?.innerHTML || ''")
-        _log(f"[CAPTCHA] body HTML 长度: {len(body_html)}")
-        if '.captcha' in body_html:
-            _log(f"[CAPTCHA] HTML 中发现 .captcha 字符串")
-    except Exception as e:
-        _log(f"[CAPTCHA] 获取 HTML 异常: {e}")
+    # 0. 先检查页面是否有基本内容（仅诊断用，调试关闭时不拉取整页 HTML）
+    if _logger.isEnabledFor(logging.DEBUG):
+        try:
+            body_html = await page.evaluate("() => document.body?.innerHTML || ''")
+            _log(f"[CAPTCHA] body HTML 长度: {len(body_html)}")
+            if '.captcha' in body_html:
+                _log(f"[CAPTCHA] HTML 中发现 .captcha 字符串")
+        except Exception as e:
+            _log(f"[CAPTCHA] 获取 HTML 异常: {e}")
 
     # 1. URL detection
-    if any(p in url for p in ["captcha", "challenge", "verify", "recaptcha", "hcaptcha", "cf-chl", "__cf_chl_", "turnstile"]):
+    if _CAPTCHA_URL_RE.search(url):
         _log(f"[CAPTCHA] URL匹配: {url}")
         return True
 
-    # 2. DOM element detection with text content check - 等待动态加载
-    _log(f"[CAPTCHA] 等待 10 秒让页面渲染...")
-    await asyncio.sleep(10.0)
-
+    # 2. DOM element detection：浏览器内轮询，元素出现即返回，未出现则短超时后走文本检测
     try:
-        # 使用 query_selector_all 直接检查
-        _log(f"[CAPTCHA] 开始 DOM 元素检测...")
-
-        # 检查外层 .captcha 容器（Bing/Cloudflare）
-        captcha_elements = await page.query_selector_all('.captcha')
-        _log(f"[CAPTCHA] .captcha 元素数: {len(captcha_elements)}")
-        if len(captcha_elements) > 0:
-            _log(f"[CAPTCHA] 找到 .captcha 容器，判定为验证页面")
-            return True
-
-        # 检查 .captcha_header 元素
-        header_elements = await page.query_selector_all('.captcha_header')
-        _log(f"[CAPTCHA] .captcha_header 元素数: {len(header_elements)}")
-        if len(header_elements) > 0:
-            try:
-                header_text = await page.evaluate('(el) => el.textContent', header_elements[0])
-                _log(f"[CAPTCHA] .captcha_header text: {repr(header_text)}")
-                _log(f"[CAPTCHA] 找到 .captcha_header，判定为验证页面")
-                return True
-            except:
-                _log(f"[CAPTCHA] 找到 .captcha_header，判定为验证页面")
-                return True
-
-        # 检查 .captcha_text 元素
-        text_elements = await page.query_selector_all('.captcha_text')
-        _log(f"[CAPTCHA] .captcha_text 元素数: {len(text_elements)}")
-        if len(text_elements) > 0:
-            try:
-                text_content = await page.evaluate('(el) => el.textContent', text_elements[0])
-                _log(f"[CAPTCHA] .captcha_text text: {repr(text_content)}")
-                _log(f"[CAPTCHA] 找到 .captcha_text，判定为验证页面")
-                return True
-            except:
-                _log(f"[CAPTCHA] 找到 .captcha_text，判定为验证页面")
-                return True
-
-        # 检查 #turnstile-widget
-        turnstile_elements = await page.query_selector_all('#turnstile-widget')
-        _log(f"[CAPTCHA] #turnstile-widget 元素数: {len(turnstile_elements)}")
-        if len(turnstile_elements) > 0:
-            _log(f"[CAPTCHA] 找到 #turnstile-widget，判定为验证页面")
-            return True
-
-        # 通用验证元素检测（包括 Cloudflare Turnstile）
-        generic_selectors = [
-            '[data-sitekey]',
-            'iframe[src*="microsoft"]',
-            'iframe[src*="recaptcha"]',
-            'iframe[src*="challenges.cloudflare.com"]',
-            'iframe[src*="cf-chl"]',
-            'input[name="cf-turnstile-response"]',
-            '.captcha-box'
-        ]
-        for sel in generic_selectors:
-            elements = await page.query_selector_all(sel)
-            if len(elements) > 0:
-                _log(f"[CAPTCHA] 通用验证元素匹配: {sel} (count: {len(elements)})")
-                return True
-
+        handle = await page.wait_for_function(_CAPTCHA_MATCH_JS, arg=_CAPTCHA_SELECTORS, timeout=1500)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _log(f"[CAPTCHA] 验证元素匹配: {await handle.json_value()}，判定为验证页面")
+        return True
+    except PlaywrightTimeoutError:
+        pass
     except Exception as e:
         _log(f"[CAPTCHA] DOM检测异常: {e}")
 
@@ -243,12 +289,10 @@ async def is_captcha_page(page) -> bool:
         body_text = await page.evaluate("() => document.body?.innerText || ''")
         _log(f"[CAPTCHA] body_text length: {len(body_text) if body_text else 0}")
         if body_text:
-            body_text_lower = body_text.lower()
-            keywords = ["请解决以下难题", "最后一步", "确认您是真人", "人机验证", "安全验证", "verify you are human", "prove you're not a robot", "just a moment", "challenge platform"]
-            for keyword in keywords:
-                if keyword in body_text_lower:
-                    _log(f"[CAPTCHA] 内容匹配: {keyword}")
-                    return True
+            m = _CAPTCHA_TEXT_RE.search(body_text.lower())
+            if m:
+                _log(f"[CAPTCHA] 内容匹配: {m.group(0)}")
+                return True
     except Exception as e:
         _log(f"[CAPTCHA] 内容检测异常: {e}")
 
@@ -263,19 +307,38 @@ async def wait_for_captcha_resolution(page, timeout_ms: int = 120000) -> None:
     :param timeout_ms: Timeout in milliseconds, default 120 seconds
     :raises: TimeoutError if timeout is exceeded
     """
-    start_time = asyncio.get_event_loop().time()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_ms / 1000
 
     while True:
-        # Timeout check
-        elapsed = (asyncio.get_event_loop().time() - start_time) * 1000
-        if elapsed > timeout_ms:
+        remaining_ms = (deadline - loop.time()) * 1000
+        if remaining_ms <= 0:
             raise TimeoutError(f"CAPTCHA resolution timeout after {timeout_ms}ms")
 
-        # Check if CAPTCHA is completed
-        if not await is_captcha_page(page):
-            # Wait a bit to ensure page is fully loaded
-            await asyncio.sleep(0.5)
+        # 在浏览器内等待验证特征全部消失（一次调用，而不是每秒一轮完整检测）
+        try:
+            await page.wait_for_function(
+                _CAPTCHA_GONE_JS,
+                arg=[_CAPTCHA_SELECTORS, _CAPTCHA_URL_RE.pattern, _CAPTCHA_TEXT_RE.pattern],
+                polling=500,
+                timeout=remaining_ms,
+            )
+        except PlaywrightTimeoutError:
+            raise TimeoutError(f"CAPTCHA resolution timeout after {timeout_ms}ms")
+        except Exception as e:
+            # 用户关闭了验证页：没有可等待的页面，直接结束（不要占着暂停锁空转）
+            if page.is_closed():
+                _log("[CAPTCHA] 验证页已关闭，停止等待")
+                return
+            # 验证通过后跳转导致执行上下文销毁：稍后在新页面上继续等待
+            if "Execution context was destroyed" in str(e):
+                _log(f"[CAPTCHA] 等待验证完成时页面跳转，重试: {e}")
+                await asyncio.sleep(0.5)
+                continue
+            # 其他异常（如 frame detached）：按已通过处理，不让单个引擎中断整个搜索
+            _log(f"[CAPTCHA] 等待验证完成异常，停止等待: {e}")
             return
 
-        # Check every second
-        await asyncio.sleep(1)
+        # Wait a bit to ensure page is fully loaded
+        await asyncio.sleep(0.5)
+        return